@@ -1,4 +1,11 @@
 import boto3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# TagResources accepts at most 20 ARNs per call
+TAG_BATCH_SIZE = 20
+# Assumed TagResources calls per second per region, used for planning and pacing
+TAG_RATE_LIMIT = 5
 
 # Function to fetch ARNs of resources that are missing a specific tag key
 def fetch_resource_arns():
@@ -59,7 +66,7 @@ def apply_tags_to_resources_by_region(resource_groups):
         try:
             tagging_client = boto3.client('resourcegroupstaggingapi', region_name=region)
 
-            resource_batches = [resources[i:i + 20] for i in range(0, len(resources), 20)]
+            resource_batches = [resources[i:i + TAG_BATCH_SIZE] for i in range(0, len(resources), TAG_BATCH_SIZE)]
 
             for batch in resource_batches:
                 tag_result = tagging_client.tag_resources(ResourceARNList=batch, Tags={'Backup': 'True'})
@@ -77,6 +84,139 @@ def apply_tags_to_resources_by_region(resource_groups):
 
     return tagged_count, failed_count, untagged_resources
 
+# Keys an auto-tagger plan must carry before it can be applied
+REQUIRED_PLAN_KEYS = ("tags", "rate_limit", "regions", "total_resources", "total_api_calls")
+
+# Convert a RateLimit value (number or string) to a positive float
+def parse_rate_limit(value):
+    try:
+        rate_limit = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"RateLimit must be a number, got {value!r}")
+    if rate_limit <= 0:
+        raise ValueError(f"RateLimit must be greater than 0, got {value!r}")
+    return rate_limit
+
+# Return a readable error if a saved plan cannot be applied, otherwise None
+def validate_tagging_plan(plan):
+    if not isinstance(plan, dict):
+        return "Plan must be a JSON object"
+    missing_keys = [key for key in REQUIRED_PLAN_KEYS if key not in plan]
+    if missing_keys:
+        return f"Plan is missing required keys {missing_keys}; was it built by a different tagger?"
+    try:
+        parse_rate_limit(plan["rate_limit"])
+    except ValueError as error:
+        return f"Plan has an invalid rate_limit: {error}"
+    if not isinstance(plan["regions"], dict):
+        return "Plan regions must be a JSON object keyed by region"
+    for region, region_plan in plan["regions"].items():
+        if not isinstance(region_plan, dict) or not isinstance(region_plan.get("batches"), list):
+            return f"Plan region {region!r} must have a list of batches"
+        if not all(isinstance(batch, list) for batch in region_plan["batches"]):
+            return f"Plan region {region!r} has a batch that is not a list of ARNs"
+    return None
+
+# Build a serialisable tagging plan without making any write calls
+def build_tagging_plan(resource_groups, tags=None, rate_limit=TAG_RATE_LIMIT):
+    tags = tags or {'Backup': 'True'}
+    rate_limit = parse_rate_limit(rate_limit)
+    plan = {
+        "tags": tags,
+        "rate_limit": rate_limit,
+        "regions": {},
+        "total_resources": 0,
+        "total_api_calls": 0,
+        "estimated_seconds": 0,
+    }
+
+    for region, resources in resource_groups.items():
+        resource_batches = [resources[i:i + TAG_BATCH_SIZE] for i in range(0, len(resources), TAG_BATCH_SIZE)]
+        api_calls = len(resource_batches)
+        estimated_seconds = round(api_calls / rate_limit, 2)
+
+        plan["regions"][region] = {
+            "batches": resource_batches,
+            "resource_count": len(resources),
+            "api_calls": api_calls,
+            "estimated_seconds": estimated_seconds,
+        }
+        plan["total_resources"] += len(resources)
+        plan["total_api_calls"] += api_calls
+        # Regions are applied in parallel, so the slowest region bounds the run time
+        plan["estimated_seconds"] = max(plan["estimated_seconds"], estimated_seconds)
+
+    return plan
+
+# Apply the batches planned for a single region, pacing calls to the plan's rate limit
+def execute_region_plan(region, region_plan, tags, rate_limit, tagging_client):
+    tagged_count = 0
+    failed_count = 0
+    untagged_resources = []
+    interval = 1 / rate_limit
+    last_call = None
+
+    try:
+        for batch in region_plan["batches"]:
+            # Sleep only for what is left of the interval so calls run at the planned rate
+            if last_call is not None:
+                time.sleep(max(0, interval - (time.monotonic() - last_call)))
+            last_call = time.monotonic()
+
+            tag_result = tagging_client.tag_resources(ResourceARNList=batch, Tags=tags)
+
+            if tag_result.get('FailedResourcesMap'):
+                failed_resources = tag_result['FailedResourcesMap'].keys()
+                print(f"Failed to tag resources in region {region}: {failed_resources}")
+                untagged_resources.extend(failed_resources)
+                failed_count += len(failed_resources)
+
+            tagged_count += len(batch) - len(tag_result.get('FailedResourcesMap', {}))
+    except Exception as error:
+        print(f"Error tagging resources in region {region}: {error}")
+        planned_count = sum(len(batch) for batch in region_plan["batches"])
+        failed_count += planned_count - tagged_count - failed_count
+
+    return tagged_count, failed_count, untagged_resources
+
+# Apply a previously built plan as is, running all regions in parallel
+def execute_tagging_plan(plan):
+    tagged_count = 0
+    failed_count = 0
+    untagged_resources = []
+
+    plan_error = validate_tagging_plan(plan)
+    if plan_error:
+        print(f"Cannot apply plan: {plan_error}")
+        return tagged_count, failed_count, untagged_resources
+
+    regions = plan["regions"]
+    if not regions:
+        return tagged_count, failed_count, untagged_resources
+
+    rate_limit = parse_rate_limit(plan["rate_limit"])
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = []
+        for region, region_plan in regions.items():
+            # boto3 sessions are not thread-safe, so clients are created here rather than in the workers
+            try:
+                tagging_client = boto3.client('resourcegroupstaggingapi', region_name=region)
+            except Exception as error:
+                print(f"Error creating tagging client for region {region}: {error}")
+                failed_count += sum(len(batch) for batch in region_plan["batches"])
+                continue
+            futures.append(executor.submit(
+                execute_region_plan, region, region_plan, plan["tags"], rate_limit, tagging_client
+            ))
+
+        for future in futures:
+            region_tagged, region_failed, region_untagged = future.result()
+            tagged_count += region_tagged
+            failed_count += region_failed
+            untagged_resources.extend(region_untagged)
+
+    return tagged_count, failed_count, untagged_resources
+
 # Retry tagging for failed resources
 def retry_failed_tags(untagged_resources):
     if not untagged_resources:
@@ -88,14 +228,59 @@ def retry_failed_tags(untagged_resources):
 
     return retry_tagged_count, retry_failed_count
 
+# Retry resources that failed while applying a plan, keeping the plan's tags and rate limit
+def retry_failed_plan_tags(plan, untagged_resources):
+    if not untagged_resources:
+        return 0, 0
+
+    print("Retrying failed resources...")
+    grouped_failed_resources = categorize_resources_by_region(untagged_resources)
+    retry_plan = build_tagging_plan(grouped_failed_resources, tags=plan["tags"], rate_limit=plan["rate_limit"])
+    retry_tagged_count, retry_failed_count, _ = execute_tagging_plan(retry_plan)
+
+    return retry_tagged_count, retry_failed_count
+
 # Lambda handler function
 def lambda_handler(event, context):
     print("Execution started...")
 
+    dry_run = str(event.get('DryRun', 'False')).lower() == 'true'
+    if dry_run and event.get('Plan'):
+        raise ValueError("DryRun cannot be combined with Plan; drop DryRun to apply the saved plan")
+
+    # Apply a saved plan without re-running discovery
+    if event.get('Plan'):
+        plan = event['Plan']
+        plan_error = validate_tagging_plan(plan)
+        if plan_error:
+            print(f"Cannot apply plan: {plan_error}")
+            return
+
+        print(f"Applying saved plan: {plan['total_resources']} resources, {plan['total_api_calls']} API calls")
+
+        tagged_count, failed_count, untagged_resources = execute_tagging_plan(plan)
+        retry_tagged_count, retry_failed_count = retry_failed_plan_tags(plan, untagged_resources)
+
+        print("\n=== Tagging Summary ===")
+        print(f"Total Resources Attempted: {plan['total_resources']}")
+        print(f"Total Resources Successfully Tagged: {tagged_count + retry_tagged_count}")
+        print(f"Total Resources Failed to Tag: {failed_count + retry_failed_count}")
+        return
+
     resources = fetch_resource_arns()
     total_resources = len(resources)
     print(f"Total resources to be tagged: {total_resources}")
 
+    # Dry run: return the plan instead of tagging anything
+    if dry_run:
+        grouped_resources = categorize_resources_by_region(resources) if resources else {}
+        plan = build_tagging_plan(grouped_resources, rate_limit=event.get('RateLimit', TAG_RATE_LIMIT))
+        print("\n=== Tagging Plan ===")
+        for region, region_plan in plan["regions"].items():
+            print(f"{region}: {region_plan['resource_count']} resources, {region_plan['api_calls']} API calls, ~{region_plan['estimated_seconds']}s")
+        print(f"Total API Calls: {plan['total_api_calls']}, Estimated Run Time: ~{plan['estimated_seconds']}s")
+        return plan
+
     if resources:
         grouped_resources = categorize_resources_by_region(resources)
 
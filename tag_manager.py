@@ -1,5 +1,7 @@
 import boto3
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
 logger = logging.getLogger()
@@ -8,11 +10,137 @@ logger.setLevel(logging.INFO)
 # Initialize the tagging client
 tagging_client = boto3.client('resourcegroupstaggingapi')
 
+# TagResources/UntagResources accept at most 20 ARNs per call
+TAG_BATCH_SIZE = 20
+# Assumed TagResources/UntagResources calls per second per region, used for planning and pacing
+TAG_RATE_LIMIT = 5
+# Keys a tag_manager plan must carry before it can be applied
+REQUIRED_PLAN_KEYS = ('action', 'tag_key', 'tag_value', 'rate_limit', 'regions', 'total_resources', 'total_api_calls')
+
 def chunk_list(data, chunk_size):
     """Helper function to split a list into smaller chunks."""
     for i in range(0, len(data), chunk_size):
         yield data[i:i + chunk_size]
 
+def parse_rate_limit(value):
+    """Convert a RateLimit value (number or string) to a positive float."""
+    try:
+        rate_limit = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"RateLimit must be a number, got {value!r}")
+    if rate_limit <= 0:
+        raise ValueError(f"RateLimit must be greater than 0, got {value!r}")
+    return rate_limit
+
+def validate_plan(plan):
+    """Return a readable error if a saved plan cannot be applied, otherwise None."""
+    if not isinstance(plan, dict):
+        return "Plan must be a JSON object"
+    missing_keys = [key for key in REQUIRED_PLAN_KEYS if key not in plan]
+    if missing_keys:
+        return f"Plan is missing required keys {missing_keys}; was it built by a different tagger?"
+    if plan['action'] not in ('tag', 'untag'):
+        return f"Plan has an unknown action {plan['action']!r}"
+    try:
+        parse_rate_limit(plan['rate_limit'])
+    except ValueError as e:
+        return f"Plan has an invalid rate_limit: {str(e)}"
+    if not isinstance(plan['regions'], dict):
+        return "Plan regions must be a JSON object keyed by region"
+    for region, region_plan in plan['regions'].items():
+        if not isinstance(region_plan, dict) or not isinstance(region_plan.get('batches'), list):
+            return f"Plan region {region!r} must have a list of batches"
+        if not all(isinstance(chunk, list) for chunk in region_plan['batches']):
+            return f"Plan region {region!r} has a batch that is not a list of ARNs"
+    return None
+
+def build_plan(rollback_value, tag_key, tag_value, rate_limit=TAG_RATE_LIMIT):
+    """Discover resources and build a serialisable plan without making any write calls."""
+    rate_limit = parse_rate_limit(rate_limit)
+    region = tagging_client.meta.region_name
+    pending = []
+
+    try:
+        paginator = tagging_client.get_paginator('get_resources')
+        for page in paginator.paginate():
+            for resource in page['ResourceTagMappingList']:
+                tags = {tag['Key']: tag['Value'] for tag in resource.get('Tags', [])}
+                # Only plan for resources whose tags would actually change
+                if rollback_value and tag_key in tags:
+                    pending.append(resource['ResourceARN'])
+                elif not rollback_value and tags.get(tag_key) != tag_value:
+                    pending.append(resource['ResourceARN'])
+    except Exception as e:
+        logger.error(f"An error occurred while retrieving resources for the plan: {str(e)}")
+
+    batches = list(chunk_list(pending, TAG_BATCH_SIZE))
+    estimated_seconds = round(len(batches) / rate_limit, 2)
+
+    return {
+        "action": "untag" if rollback_value else "tag",
+        "tag_key": tag_key,
+        "tag_value": tag_value,
+        "rate_limit": rate_limit,
+        "regions": {
+            region: {
+                "batches": batches,
+                "resource_count": len(pending),
+                "api_calls": len(batches),
+                "estimated_seconds": estimated_seconds,
+            }
+        } if batches else {},
+        "total_resources": len(pending),
+        "total_api_calls": len(batches),
+        "estimated_seconds": estimated_seconds,
+    }
+
+def execute_region_plan(plan, region, region_plan, client):
+    """Apply the batches planned for one region, pacing calls to the plan's rate limit."""
+    processed = 0
+    last_call = None
+
+    for chunk in region_plan['batches']:
+        try:
+            # Sleep only for what is left of the interval so calls run at the planned rate
+            if last_call is not None:
+                time.sleep(max(0, 1 / plan['rate_limit'] - (time.monotonic() - last_call)))
+            last_call = time.monotonic()
+            if plan['action'] == 'untag':
+                client.untag_resources(ResourceARNList=chunk, TagKeys=[plan['tag_key']])
+                logger.info(f"Deleted tag '{plan['tag_key']}' from resources: {chunk}")
+            else:
+                client.tag_resources(ResourceARNList=chunk, Tags={plan['tag_key']: plan['tag_value']})
+                logger.info(f"Added tag '{plan['tag_key']}' with value '{plan['tag_value']}' to resources: {chunk}")
+            processed += len(chunk)
+        except Exception as e:
+            logger.error(f"Failed to process resources {chunk} in region {region}: {str(e)}")
+
+    return processed
+
+def execute_plan(plan):
+    """Apply a saved plan as is, running all regions in parallel."""
+    plan_error = validate_plan(plan)
+    if plan_error:
+        logger.error(f"Cannot apply plan: {plan_error}")
+        return 0
+
+    regions = plan['regions']
+    if not regions:
+        return 0
+
+    plan = dict(plan, rate_limit=parse_rate_limit(plan['rate_limit']))
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = []
+        for region, region_plan in regions.items():
+            # boto3 sessions are not thread-safe, so clients are created here rather than in the workers
+            try:
+                client = boto3.client('resourcegroupstaggingapi', region_name=region)
+            except Exception as e:
+                logger.error(f"Failed to create tagging client for region {region}: {str(e)}")
+                continue
+            futures.append(executor.submit(execute_region_plan, plan, region, region_plan, client))
+        return sum(future.result() for future in futures)
+
 def lambda_handler(event, context):
     tag_key = "Backup"
     tag_value = "True"
@@ -22,6 +150,29 @@ def lambda_handler(event, context):
     rollback_value = rollback_value.lower() == 'true'  # Convert to boolean
     logger.info(f"Received Rollback value: {rollback_value}")
 
+    dry_run = str(event.get('DryRun', 'False')).lower() == 'true'
+    if dry_run and event.get('Plan'):
+        raise ValueError("DryRun cannot be combined with Plan; drop DryRun to apply the saved plan")
+
+    # Dry run: return the plan instead of writing any tags
+    if dry_run:
+        plan = build_plan(rollback_value, tag_key, tag_value, event.get('RateLimit', TAG_RATE_LIMIT))
+        logger.info(f"Planned action '{plan['action']}' on {plan['total_resources']} resources")
+        logger.info(f"Total API Calls: {plan['total_api_calls']}, Estimated Run Time: ~{plan['estimated_seconds']}s")
+        return plan
+
+    # Apply a saved plan without re-running discovery
+    if event.get('Plan'):
+        plan = event['Plan']
+        plan_error = validate_plan(plan)
+        if plan_error:
+            logger.error(f"Cannot apply plan: {plan_error}")
+            return
+        logger.info(f"Applying saved plan: {plan['total_resources']} resources, {plan['total_api_calls']} API calls")
+        processed = execute_plan(plan)
+        logger.info(f"Total Resources Processed: {processed} of {plan['total_resources']}")
+        return
+
     resources_processed = 0
     total_tagged = 0
     total_untagged = 0
@@ -37,7 +188,7 @@ def lambda_handler(event, context):
             logger.info(f"Discovered resources: {resource_list}")
             
             # Process resources in chunks of 20
-            for chunk in chunk_list(resource_list, 20):
+            for chunk in chunk_list(resource_list, TAG_BATCH_SIZE):
                 try:
                     if rollback_value:
                         # Rollback = True: Delete Backup: True tag
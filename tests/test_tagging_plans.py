@@ -0,0 +1,327 @@
+import importlib.util
+import json
+import pathlib
+import threading
+from unittest import mock
+
+import pytest
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def load_module(name, filename):
+    """Import a Lambda script by path with boto3.client mocked at import time."""
+    spec = importlib.util.spec_from_file_location(name, REPO_ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch("boto3.client"):
+        spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def auto_tagger():
+    return load_module("auto_tagger", "aws-resource-auto-tagger.py")
+
+
+@pytest.fixture
+def tag_manager():
+    return load_module("tag_manager", "tag_manager.py")
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    with mock.patch("time.sleep"):
+        yield
+
+
+def arns(region, count):
+    return [f"arn:aws:ec2:{region}:123456789012:instance/i-{i}" for i in range(count)]
+
+
+def tagging_client(failed=()):
+    client = mock.MagicMock()
+    client.tag_resources.side_effect = lambda ResourceARNList, Tags: {
+        "FailedResourcesMap": {arn: {} for arn in ResourceARNList if arn in failed}
+    }
+    return client
+
+
+def wait_then_succeed(barrier):
+    barrier.wait()
+    return {}
+
+
+# aws-resource-auto-tagger.py
+
+def test_build_tagging_plan_estimates_batches_calls_and_time(auto_tagger):
+    plan = auto_tagger.build_tagging_plan(
+        {"us-east-1": arns("us-east-1", 45), "eu-west-1": arns("eu-west-1", 5)},
+        rate_limit="2",
+    )
+
+    assert plan["rate_limit"] == 2.0
+    assert [len(batch) for batch in plan["regions"]["us-east-1"]["batches"]] == [20, 20, 5]
+    assert plan["regions"]["us-east-1"]["api_calls"] == 3
+    assert plan["regions"]["us-east-1"]["estimated_seconds"] == 1.5
+    assert plan["regions"]["eu-west-1"]["api_calls"] == 1
+    assert plan["total_resources"] == 50
+    assert plan["total_api_calls"] == 4
+    # Regions run in parallel, so the slowest region bounds the estimate
+    assert plan["estimated_seconds"] == 1.5
+    assert json.loads(json.dumps(plan)) == plan
+
+
+@pytest.mark.parametrize("rate_limit", [0, -1, "0", "fast", None])
+def test_build_tagging_plan_rejects_invalid_rate_limit(auto_tagger, rate_limit):
+    with pytest.raises(ValueError, match="RateLimit"):
+        auto_tagger.build_tagging_plan({}, rate_limit=rate_limit)
+
+
+def test_execute_region_plan_counts_failures(auto_tagger):
+    resources = arns("us-east-1", 25)
+    client = tagging_client(failed={resources[0], resources[21]})
+    region_plan = auto_tagger.build_tagging_plan({"us-east-1": resources})["regions"]["us-east-1"]
+
+    tagged, failed, untagged = auto_tagger.execute_region_plan("us-east-1", region_plan, {"Backup": "True"}, 5, client)
+
+    assert (tagged, failed) == (23, 2)
+    assert sorted(untagged) == sorted([resources[0], resources[21]])
+
+
+def test_execute_region_plan_counts_unprocessed_batches_on_error(auto_tagger):
+    client = mock.MagicMock()
+    client.tag_resources.side_effect = [{}, Exception("throttled")]
+    region_plan = auto_tagger.build_tagging_plan({"us-east-1": arns("us-east-1", 45)})["regions"]["us-east-1"]
+
+    # An edited resource_count must not affect the count of unprocessed resources
+    region_plan["resource_count"] = 1000
+
+    tagged, failed, _ = auto_tagger.execute_region_plan("us-east-1", region_plan, {"Backup": "True"}, 5, client)
+
+    assert (tagged, failed) == (20, 25)
+
+
+def test_execute_region_plan_sleeps_only_the_rest_of_each_interval(auto_tagger):
+    region_plan = auto_tagger.build_tagging_plan({"us-east-1": arns("us-east-1", 60)})["regions"]["us-east-1"]
+    # Each call starts at t, the next check happens 0.15s later
+    clock = iter([0.0, 0.15, 0.2, 0.35, 0.4])
+
+    with mock.patch("time.monotonic", side_effect=lambda: next(clock)), mock.patch("time.sleep") as sleep:
+        auto_tagger.execute_region_plan("us-east-1", region_plan, {"Backup": "True"}, 5, tagging_client())
+
+    assert [call.args[0] for call in sleep.call_args_list] == pytest.approx([0.05, 0.05])
+
+
+def test_execute_tagging_plan_runs_regions_in_parallel(auto_tagger):
+    regions = ["us-east-1", "eu-west-1", "ap-southeast-1"]
+    plan = auto_tagger.build_tagging_plan({region: arns(region, 3) for region in regions})
+    # Every region's worker must be running at the same time to get past the barrier
+    barrier = threading.Barrier(len(regions), timeout=5)
+    creating_threads = []
+
+    def client_for(service, region_name):
+        creating_threads.append(threading.current_thread())
+        client = mock.MagicMock()
+        client.tag_resources.side_effect = lambda **kwargs: wait_then_succeed(barrier)
+        return client
+
+    with mock.patch("boto3.client", side_effect=client_for):
+        tagged, failed, untagged = auto_tagger.execute_tagging_plan(plan)
+
+    assert (tagged, failed, untagged) == (9, 0, [])
+    # Clients are created in the calling thread, not in the workers
+    assert creating_threads == [threading.current_thread()] * len(regions)
+
+
+def test_handler_rejects_malformed_region_in_saved_plan(auto_tagger):
+    plan = auto_tagger.build_tagging_plan({"us-east-1": arns("us-east-1", 1)})
+    plan["regions"]["eu-west-1"] = {"resource_count": 1}
+
+    with mock.patch("boto3.client") as client_factory:
+        auto_tagger.lambda_handler({"Plan": plan}, None)
+    client_factory.assert_not_called()
+
+
+def test_handler_ignores_rate_limit_outside_dry_run(auto_tagger):
+    plan = auto_tagger.build_tagging_plan({"us-east-1": arns("us-east-1", 1)})
+
+    with mock.patch("boto3.client", return_value=tagging_client()) as client_factory:
+        auto_tagger.lambda_handler({"Plan": plan, "RateLimit": "0"}, None)
+    client_factory.return_value.tag_resources.assert_called_once()
+
+
+def test_execute_tagging_plan_rejects_plan_from_tag_manager(auto_tagger, tag_manager):
+    with mock.patch.object(tag_manager, "tagging_client") as client:
+        client.meta.region_name = "us-east-1"
+        client.get_paginator.return_value.paginate.return_value = [
+            {"ResourceTagMappingList": [{"ResourceARN": arn, "Tags": []} for arn in arns("us-east-1", 2)]}
+        ]
+        plan = tag_manager.build_plan(False, "Backup", "True")
+
+    with mock.patch("boto3.client") as client_factory:
+        assert auto_tagger.execute_tagging_plan(plan) == (0, 0, [])
+    client_factory.assert_not_called()
+
+
+def test_saved_plan_retries_with_plan_tags(auto_tagger):
+    resources = arns("us-east-1", 3)
+    plan = auto_tagger.build_tagging_plan({"us-east-1": resources}, tags={"ENV": "Prod"})
+    client = mock.MagicMock()
+    client.tag_resources.side_effect = [{"FailedResourcesMap": {resources[0]: {}}}, {}]
+
+    with mock.patch("boto3.client", return_value=client):
+        auto_tagger.lambda_handler({"Plan": plan}, None)
+
+    assert client.tag_resources.call_count == 2
+    assert client.tag_resources.call_args_list[1] == mock.call(ResourceARNList=[resources[0]], Tags={"ENV": "Prod"})
+
+
+def test_handler_dry_run_with_plan_never_writes(auto_tagger):
+    plan = auto_tagger.build_tagging_plan({"us-east-1": arns("us-east-1", 3)})
+
+    with mock.patch("boto3.client") as client_factory, pytest.raises(ValueError, match="DryRun"):
+        auto_tagger.lambda_handler({"DryRun": "true", "Plan": plan}, None)
+    client_factory.return_value.tag_resources.assert_not_called()
+
+
+def test_handler_dry_run_returns_plan(auto_tagger):
+    resources = arns("us-east-1", 3) + arns("eu-west-1", 2)
+
+    with mock.patch.object(auto_tagger, "fetch_resource_arns", return_value=resources), \
+            mock.patch("boto3.client") as client_factory:
+        plan = auto_tagger.lambda_handler({"DryRun": "True", "RateLimit": "10"}, None)
+
+    client_factory.assert_not_called()
+    assert plan["rate_limit"] == 10.0
+    assert plan["total_resources"] == 5
+    assert set(plan["regions"]) == {"us-east-1", "eu-west-1"}
+
+
+def test_handler_dry_run_with_no_resources_returns_empty_plan(auto_tagger):
+    with mock.patch.object(auto_tagger, "fetch_resource_arns", return_value=[]):
+        plan = auto_tagger.lambda_handler({"DryRun": "True"}, None)
+
+    assert plan["regions"] == {}
+    assert plan["total_api_calls"] == 0
+
+
+# tag_manager.py
+
+def discovered(*resources):
+    return [{"ResourceTagMappingList": [
+        {"ResourceARN": arn, "Tags": [{"Key": key, "Value": value} for key, value in tags.items()]}
+        for arn, tags in resources
+    ]}]
+
+
+@pytest.fixture
+def discovery(tag_manager):
+    with mock.patch.object(tag_manager, "tagging_client") as client:
+        client.meta.region_name = "us-east-1"
+        client.get_paginator.return_value.paginate.return_value = discovered(
+            ("arn:a", {}),
+            ("arn:b", {"Backup": "True"}),
+            ("arn:c", {"Backup": "False"}),
+        )
+        yield client
+
+
+def test_build_plan_only_includes_resources_that_change(tag_manager, discovery):
+    plan = tag_manager.build_plan(False, "Backup", "True", rate_limit="4")
+
+    assert plan["action"] == "tag"
+    assert plan["rate_limit"] == 4.0
+    assert plan["regions"]["us-east-1"]["batches"] == [["arn:a", "arn:c"]]
+    assert plan["total_api_calls"] == 1
+    assert plan["estimated_seconds"] == 0.25
+
+
+def test_build_plan_rollback_only_includes_tagged_resources(tag_manager, discovery):
+    plan = tag_manager.build_plan(True, "Backup", "True")
+
+    assert plan["action"] == "untag"
+    assert plan["regions"]["us-east-1"]["batches"] == [["arn:b", "arn:c"]]
+
+
+def test_build_plan_logs_discovery_errors(tag_manager, discovery):
+    discovery.get_paginator.side_effect = Exception("AccessDenied")
+
+    with mock.patch.object(tag_manager.logger, "error") as log_error:
+        plan = tag_manager.build_plan(False, "Backup", "True")
+
+    log_error.assert_called_once()
+    assert plan["regions"] == {}
+
+
+def test_build_plan_batches_by_batch_size(tag_manager, discovery):
+    discovery.get_paginator.return_value.paginate.return_value = discovered(
+        *[(arn, {}) for arn in arns("us-east-1", tag_manager.TAG_BATCH_SIZE + 1)]
+    )
+
+    plan = tag_manager.build_plan(False, "Backup", "True")
+
+    assert [len(batch) for batch in plan["regions"]["us-east-1"]["batches"]] == [tag_manager.TAG_BATCH_SIZE, 1]
+
+
+def test_execute_plan_runs_regions_in_parallel(tag_manager):
+    regions = ["us-east-1", "eu-west-1"]
+    plan = {
+        "action": "untag", "tag_key": "Backup", "tag_value": "True", "rate_limit": "5",
+        "regions": {region: {"batches": [arns(region, 2)], "resource_count": 2} for region in regions},
+        "total_resources": 4, "total_api_calls": 2,
+    }
+    barrier = threading.Barrier(len(regions), timeout=5)
+    clients = []
+
+    def client_for(service, region_name):
+        assert threading.current_thread() is threading.main_thread()
+        client = mock.MagicMock()
+        client.untag_resources.side_effect = lambda **kwargs: wait_then_succeed(barrier)
+        clients.append(client)
+        return client
+
+    with mock.patch("boto3.client", side_effect=client_for):
+        assert tag_manager.execute_plan(plan) == 4
+    assert [client.untag_resources.call_count for client in clients] == [1, 1]
+    assert not any(client.tag_resources.called for client in clients)
+
+
+def test_execute_region_plan_keeps_going_after_failed_chunk(tag_manager):
+    plan = {"action": "tag", "tag_key": "Backup", "tag_value": "True", "rate_limit": 5.0}
+    client = mock.MagicMock()
+    client.tag_resources.side_effect = [Exception("throttled"), {}]
+
+    processed = tag_manager.execute_region_plan(plan, "us-east-1", {"batches": [["arn:a"], ["arn:b"]]}, client)
+
+    assert processed == 1
+
+
+@pytest.mark.parametrize("plan", [
+    {"tags": {"Backup": "True"}, "rate_limit": 5, "regions": {}, "total_resources": 0, "total_api_calls": 0},
+    {"action": "tag", "tag_key": "Backup", "tag_value": "True", "rate_limit": 0,
+     "regions": {"us-east-1": {"batches": [["arn:a"], ["arn:b"]]}}, "total_resources": 2, "total_api_calls": 2},
+    {"action": "tag", "tag_key": "Backup", "tag_value": "True", "rate_limit": 5,
+     "regions": {"us-east-1": {"resource_count": 1}}, "total_resources": 1, "total_api_calls": 1},
+    {"action": "tag", "tag_key": "Backup", "tag_value": "True", "rate_limit": 5,
+     "regions": [["arn:a"]], "total_resources": 1, "total_api_calls": 1},
+])
+def test_execute_plan_rejects_invalid_plans(tag_manager, plan):
+    with mock.patch("boto3.client") as client_factory, mock.patch.object(tag_manager.logger, "error") as log_error:
+        assert tag_manager.execute_plan(plan) == 0
+
+    client_factory.assert_not_called()
+    assert "Cannot apply plan" in log_error.call_args[0][0]
+
+
+def test_handler_dry_run_with_plan_never_writes(tag_manager, discovery):
+    plan = tag_manager.build_plan(False, "Backup", "True")
+
+    with mock.patch("boto3.client") as client_factory, pytest.raises(ValueError, match="DryRun"):
+        tag_manager.lambda_handler({"DryRun": "true", "Plan": plan}, None)
+    client_factory.assert_not_called()
+    discovery.tag_resources.assert_not_called()
+
+
+def test_handler_rejects_invalid_rate_limit(tag_manager, discovery):
+    with pytest.raises(ValueError, match="greater than 0"):
+        tag_manager.lambda_handler({"DryRun": "true", "RateLimit": 0}, None)